@@ -21,7 +21,7 @@ def main():
     # Extract text from PDF CV
     with open(pdf_path, 'rb') as f:
         try:
-            cv_text = PDFExtractor.extract_text_from_pdf(f)
+            cv_text, ocr_stats = PDFExtractor.extract_text_with_stats(f)
         except Exception as e:
             print(f'Error extracting text: {e}', file=sys.stderr)
             sys.exit(1)
@@ -38,6 +38,7 @@ def main():
     except Exception as e:
         print(str(e), file=sys.stderr)
         sys.exit(1)
+    result['ocr_stats'] = ocr_stats
 
     # Print JSON result to stdout only
     print(json.dumps(result, ensure_ascii=False))
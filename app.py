@@ -151,6 +151,12 @@ def display_results(result):
     st.markdown(f"<div style='margin-bottom:1.5em;'>{result.get('candidate_summary', '')}</div>", unsafe_allow_html=True)
     st.markdown("<h4 style='margin-bottom:0.5em;'>Analysis</h4>", unsafe_allow_html=True)
     st.markdown(f"<div style='margin-bottom:1.5em;'>{re.sub(r'\s+', ' ', result.get('analysis', '')).strip()}</div>", unsafe_allow_html=True)
+    ocr_stats = result.get('ocr_stats')
+    if ocr_stats:
+        st.caption(
+            f"OCR: {ocr_stats['pages_total']} pages, "
+            f"{ocr_stats['pages_reused']} reused from cache, {ocr_stats['pages_sent']} sent"
+        )
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -2,30 +2,234 @@
 PDF Extractor (Mistral OCR only)
 
 Handles text extraction from PDFs using the Mistral OCR API via direct HTTP requests.
+Pages are fingerprinted individually so that a revised CV only sends new or
+changed pages to OCR; markdown for unchanged pages is reused from a page cache.
+
+The page cache holds OCR text of uploaded CVs, i.e. candidate personal data.
+It is stored in a private directory (0700, file 0600), entries expire after
+PAGE_CACHE_TTL_SECONDS, and setting OCR_PAGE_CACHE_TTL_DAYS=0 disables it.
 """
 
 import base64
+import hashlib
+import io
 import os
+import re
 import sys
 import json
+import tempfile
+import time
 import urllib.request
 import urllib.parse
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import IndirectObject, StreamObject
+
+from utils.json_io import load_json
+
+# Private directory holding the page cache (fingerprint -> markdown). It lives on
+# disk because each analysis runs in a fresh process (see app.py).
+PAGE_CACHE_DIR = os.environ.get(
+    "OCR_PAGE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "smart_hr")
+)
+PAGE_CACHE_FILE = "ocr_page_cache.json"
+PAGE_CACHE_TTL_DAYS_DEFAULT = 7.0
+
+
+def _parse_cache_ttl_seconds(value: Optional[str]) -> float:
+    """Convert OCR_PAGE_CACHE_TTL_DAYS to seconds, falling back to the default if invalid."""
+    if value is None or not value.strip():
+        return PAGE_CACHE_TTL_DAYS_DEFAULT * 24 * 3600
+    try:
+        days = float(value)
+    except ValueError:
+        print(
+            f"Invalid OCR_PAGE_CACHE_TTL_DAYS={value!r}, using {PAGE_CACHE_TTL_DAYS_DEFAULT:g} days.",
+            file=sys.stderr,
+        )
+        days = PAGE_CACHE_TTL_DAYS_DEFAULT
+    return days * 24 * 3600
+
+
+# Entries older than this are dropped; 0 disables the cache entirely
+PAGE_CACHE_TTL_SECONDS = _parse_cache_ttl_seconds(os.environ.get("OCR_PAGE_CACHE_TTL_DAYS"))
+# Least recently used entries are dropped once the cache grows past this many pages
+PAGE_CACHE_MAX_ENTRIES = 2000
+
+# Subset fonts are named with a random tag, e.g. /ABCDEF+Calibri
+_SUBSET_TAG = re.compile(r"^/?[A-Z]{6}\+")
+# Keys that point back up the document tree rather than into page content
+_SKIPPED_KEYS = ("/Parent", "/P")
+
 
 class PDFExtractor:
     """Extract text from PDF files using Mistral OCR API via direct HTTP requests."""
     @staticmethod
     def extract_text_from_pdf(pdf_file) -> Optional[str]:
         """Extract text from a PDF file using Mistral OCR API."""
+        text, _ = PDFExtractor.extract_text_with_stats(pdf_file)
+        return text
+
+    @staticmethod
+    def extract_text_with_stats(pdf_file) -> Tuple[Optional[str], dict]:
+        """Extract text, OCRing only pages not already in the page cache.
+
+        Returns the document text and a stats dict with the total page count,
+        the number of pages reused (from cache or duplicated within the upload)
+        and the number sent to OCR; reused + sent always equals total.
+        """
         api_key = os.environ.get("MISTRAL_API_KEY")
         if not api_key:
             raise RuntimeError("MISTRAL_API_KEY not set in environment.")
-        
-        # Read and encode PDF to base64
+
         pdf_file.seek(0)
         pdf_bytes = pdf_file.read()
+
+        try:
+            reader = PdfReader(io.BytesIO(pdf_bytes))
+            pages = list(reader.pages)
+            memo: Dict[tuple, bytes] = {}
+            fingerprints = [PDFExtractor._fingerprint_page(page, memo) for page in pages]
+
+            cache = PDFExtractor._load_page_cache()
+            # Deduplicate identical pages so each distinct page is OCRed once
+            to_send: List[int] = []
+            seen = set()
+            for i, fp in enumerate(fingerprints):
+                if fp not in cache and fp not in seen:
+                    seen.add(fp)
+                    to_send.append(i)
+
+            sub_pdf = None
+            if to_send:
+                writer = PdfWriter()
+                for i in to_send:
+                    writer.add_page(pages[i])
+                buffer = io.BytesIO()
+                writer.write(buffer)
+                sub_pdf = buffer.getvalue()
+        except Exception as e:
+            # Cannot split locally: fall back to sending the whole document
+            print(f"Page splitting failed, OCRing full document: {e}", file=sys.stderr)
+            markdowns = PDFExtractor._ocr_pdf_bytes(pdf_bytes, api_key)
+            stats = {"pages_total": len(markdowns), "pages_reused": 0, "pages_sent": len(markdowns)}
+            return PDFExtractor._join_pages(markdowns), stats
+
+        now = time.time()
+        updates: Dict[str, dict] = {}
+        if sub_pdf is not None:
+            markdowns = PDFExtractor._ocr_pdf_bytes(sub_pdf, api_key)
+            if len(markdowns) != len(to_send):
+                raise RuntimeError(
+                    f"OCR returned {len(markdowns)} pages, expected {len(to_send)}."
+                )
+            for i, markdown in zip(to_send, markdowns):
+                updates[fingerprints[i]] = {"markdown": markdown, "created": now}
+
+        page_texts = []
+        for fp in fingerprints:
+            entry = updates.get(fp) or cache[fp]
+            # Re-inserting on use moves the entry to the end, so eviction is LRU
+            updates[fp] = entry
+            page_texts.append(entry["markdown"])
+        PDFExtractor._save_page_cache(updates)
+
+        stats = {
+            "pages_total": len(pages),
+            "pages_reused": len(pages) - len(to_send),
+            "pages_sent": len(to_send),
+        }
+        return PDFExtractor._join_pages(page_texts), stats
+
+    @staticmethod
+    def _fingerprint_page(page, memo: Optional[Dict[tuple, bytes]] = None) -> str:
+        """Hash what OCR sees on a page: content stream, images and visible geometry.
+
+        Fonts contribute only a stable identity (see _font_identity), since
+        exporters regenerate shared subset fonts whenever any page changes.
+        Pass one memo per document so shared resources are hashed once.
+        """
+        if memo is None:
+            memo = {}
+        digest = hashlib.sha256()
+        digest.update(repr([float(v) for v in page.mediabox]).encode("utf-8"))
+        digest.update(repr([float(v) for v in page.cropbox]).encode("utf-8"))
+        digest.update(str(page.rotation).encode("utf-8"))
+        contents = page.get_contents()
+        if contents is not None:
+            digest.update(contents.get_data())
+        resources = page.get("/Resources")
+        if resources is not None:
+            digest.update(PDFExtractor._object_digest(resources, memo, set()))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _object_digest(obj, memo: Dict[tuple, bytes], stack: set) -> bytes:
+        """Digest a PDF object graph, memoizing indirect objects by reference."""
+        if isinstance(obj, IndirectObject):
+            # Object numbers are not hashed: they shift when a revised CV is re-exported
+            key = (obj.idnum, obj.generation)
+            if key in memo:
+                return memo[key]
+            if key in stack:
+                return b"<cycle>"
+            stack.add(key)
+            memo[key] = PDFExtractor._object_digest(obj.get_object(), memo, stack)
+            stack.discard(key)
+            return memo[key]
+
+        digest = hashlib.sha256()
+        if isinstance(obj, dict):
+            digest.update(b"<<")
+            for name in sorted(obj.keys()):
+                if name in _SKIPPED_KEYS:
+                    continue
+                digest.update(str(name).encode("utf-8"))
+                # raw_get keeps indirect references so memo and cycle guard see them
+                value = obj.raw_get(name)
+                if name == "/Font":
+                    digest.update(PDFExtractor._fonts_digest(value.get_object(), memo, stack))
+                else:
+                    digest.update(PDFExtractor._object_digest(value, memo, stack))
+            digest.update(b">>")
+            if isinstance(obj, StreamObject):
+                digest.update(obj.get_data())
+        elif isinstance(obj, list):
+            digest.update(b"[")
+            for item in obj:
+                digest.update(PDFExtractor._object_digest(item, memo, stack))
+            digest.update(b"]")
+        else:
+            digest.update(repr(obj).encode("utf-8"))
+        return digest.digest()
+
+    @staticmethod
+    def _fonts_digest(fonts, memo: Dict[tuple, bytes], stack: set) -> bytes:
+        digest = hashlib.sha256()
+        for name in sorted(fonts.keys()):
+            font = fonts[name]
+            digest.update(str(name).encode("utf-8"))
+            digest.update(repr(PDFExtractor._font_identity(font)).encode("utf-8"))
+            if "/Encoding" in font:
+                digest.update(PDFExtractor._object_digest(font.raw_get("/Encoding"), memo, stack))
+        return digest.digest()
+
+    @staticmethod
+    def _font_identity(font) -> Tuple[str, str]:
+        """Subtype and base font name without the 6-letter subset tag (ABCDEF+).
+
+        The embedded font program and /ToUnicode are left out on purpose: they
+        change with the glyph subset even on pages whose text did not change.
+        """
+        base_font = _SUBSET_TAG.sub("", str(font.get("/BaseFont", "")))
+        return str(font.get("/Subtype", "")), base_font
+
+    @staticmethod
+    def _ocr_pdf_bytes(pdf_bytes: bytes, api_key: str) -> List[str]:
+        """Send a PDF to Mistral OCR and return the markdown of each page in order."""
         base64_pdf = base64.b64encode(pdf_bytes).decode('utf-8')
-        
+
         # Call Mistral OCR API directly via HTTP using urllib
         url = "https://api.mistral.ai/v1/ocr"
         headers = {
@@ -40,16 +244,76 @@ class PDFExtractor:
             },
             "include_image_base64": True
         }
-        
+
         # Prepare the request
         json_data = json.dumps(data).encode('utf-8')
         req = urllib.request.Request(url, data=json_data, headers=headers, method='POST')
-        
+
         # Make the request
         with urllib.request.urlopen(req) as response:
             response_data = response.read()
             ocr_response = json.loads(response_data.decode('utf-8'))
-        
-        # Parse response and extract text
-        all_text = "\n\n".join(page["markdown"] for page in ocr_response["pages"])
-        return all_text if all_text.strip() else None 
\ No newline at end of file
+
+        ocr_pages = sorted(ocr_response["pages"], key=lambda page: page.get("index", 0))
+        return [page["markdown"] for page in ocr_pages]
+
+    @staticmethod
+    def _join_pages(markdowns: List[str]) -> Optional[str]:
+        all_text = "\n\n".join(markdowns)
+        return all_text if all_text.strip() else None
+
+    @staticmethod
+    def _cache_path() -> str:
+        return os.path.join(PAGE_CACHE_DIR, PAGE_CACHE_FILE)
+
+    @staticmethod
+    def _load_page_cache() -> Dict[str, dict]:
+        """Load unexpired, well-formed cache entries; anything unreadable counts as empty."""
+        if PAGE_CACHE_TTL_SECONDS <= 0:
+            return {}
+        path = PDFExtractor._cache_path()
+        if not os.path.exists(path):
+            return {}
+        try:
+            data = load_json(path)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        cutoff = time.time() - PAGE_CACHE_TTL_SECONDS
+        return {
+            fp: entry for fp, entry in data.items()
+            if isinstance(entry, dict)
+            and isinstance(entry.get("markdown"), str)
+            and isinstance(entry.get("created"), (int, float))
+            and entry["created"] >= cutoff
+        }
+
+    @staticmethod
+    def _save_page_cache(updates: Dict[str, dict]):
+        """Merge updates into the cache on disk and replace the file atomically.
+
+        Re-reading just before writing keeps entries added by concurrent runs.
+        """
+        if PAGE_CACHE_TTL_SECONDS <= 0 or not updates:
+            return
+        try:
+            os.makedirs(PAGE_CACHE_DIR, mode=0o700, exist_ok=True)
+            cache = PDFExtractor._load_page_cache()
+            for fp, entry in updates.items():
+                cache.pop(fp, None)
+                cache[fp] = entry
+            # Dicts keep insertion order, so the first keys are least recently used
+            while len(cache) > PAGE_CACHE_MAX_ENTRIES:
+                del cache[next(iter(cache))]
+            # mkstemp creates the file with 0600 permissions
+            fd, tmp_path = tempfile.mkstemp(dir=PAGE_CACHE_DIR, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(cache, f, ensure_ascii=False)
+                os.replace(tmp_path, PDFExtractor._cache_path())
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Could not write OCR page cache: {e}", file=sys.stderr)
@@ -0,0 +1,240 @@
+import io
+import json
+import os
+import re
+import stat
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, EncodedStreamObject
+
+from pdf_processing import pdf_extractor
+from pdf_processing.pdf_extractor import PDFExtractor
+
+
+def build_pdf(objects):
+    """Serialize PDF objects (bodies of objects 1..n, 1 being the catalog) with a valid xref."""
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def stream(data, extra=b""):
+    return b"<< /Length %d %s>>\nstream\n" % (len(data), extra) + data + b"\nendstream"
+
+
+def cv_pdf(pages):
+    """Build a PDF with one page per (text, base_font) pair."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None]
+    kids = []
+    for text, base_font in pages:
+        page_num = len(objects) + 1
+        kids.append(b"%d 0 R" % page_num)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>" % (page_num + 1, page_num + 2)
+        )
+        objects.append(stream(b"BT /F1 12 Tf 72 720 Td (" + text.encode() + b") Tj ET"))
+        objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /" + base_font.encode() + b" >>")
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids)
+    return io.BytesIO(build_pdf(objects))
+
+
+def shared_subset_font_pdf(texts, subset_tag, font_program):
+    """Build a PDF whose pages all use one embedded subset TrueType font."""
+    count = len(texts)
+    font_num = 3 + 2 * count
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (3 + 2 * i) for i in range(count)) + b"] /Count %d >>" % count,
+    ]
+    for i, text in enumerate(texts):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>" % (4 + 2 * i, font_num)
+        )
+        objects.append(stream(b"BT /F1 12 Tf 72 720 Td (" + text.encode() + b") Tj ET"))
+    base_font = subset_tag.encode() + b"+Calibri"
+    objects.append(
+        b"<< /Type /Font /Subtype /TrueType /BaseFont /" + base_font + b" /Encoding /WinAnsiEncoding "
+        b"/FontDescriptor %d 0 R /ToUnicode %d 0 R >>" % (font_num + 1, font_num + 3)
+    )
+    objects.append(b"<< /Type /FontDescriptor /FontName /" + base_font + b" /FontFile2 %d 0 R >>" % (font_num + 2))
+    objects.append(stream(font_program))
+    objects.append(stream(b"cmap for " + font_program))
+    return io.BytesIO(build_pdf(objects))
+
+
+@pytest.fixture
+def ocr_calls(tmp_path, monkeypatch):
+    """Isolate the page cache and replace the OCR call with one that echoes page text."""
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-key")
+    monkeypatch.setattr(pdf_extractor, "PAGE_CACHE_DIR", str(tmp_path / "cache"))
+    calls = []
+
+    def fake_ocr(pdf_bytes, api_key):
+        try:
+            pages = PdfReader(io.BytesIO(pdf_bytes)).pages
+            texts = [re.search(rb"\((.*)\)", page.get_contents().get_data()).group(1).decode() for page in pages]
+        except Exception:
+            texts = ["full document"]
+        calls.append(texts)
+        return texts
+
+    monkeypatch.setattr(PDFExtractor, "_ocr_pdf_bytes", staticmethod(fake_ocr))
+    return calls
+
+
+def test_revised_pdf_sends_only_changed_pages(ocr_calls):
+    PDFExtractor.extract_text_with_stats(cv_pdf([("one", "Helvetica"), ("two", "Helvetica"), ("three", "Helvetica")]))
+    text, stats = PDFExtractor.extract_text_with_stats(
+        cv_pdf([("one", "Helvetica"), ("two revised", "Helvetica"), ("three", "Helvetica")])
+    )
+
+    assert ocr_calls == [["one", "two", "three"], ["two revised"]]
+    assert text == "one\n\ntwo revised\n\nthree"
+    assert stats == {"pages_total": 3, "pages_reused": 2, "pages_sent": 1}
+
+
+def test_output_is_in_page_order(ocr_calls):
+    PDFExtractor.extract_text_with_stats(cv_pdf([("b", "Helvetica")]))
+    text, _ = PDFExtractor.extract_text_with_stats(cv_pdf([("a", "Helvetica"), ("b", "Helvetica"), ("c", "Helvetica")]))
+
+    assert ocr_calls[-1] == ["a", "c"]
+    assert text == "a\n\nb\n\nc"
+
+
+def test_duplicate_pages_are_ocred_once(ocr_calls):
+    text, stats = PDFExtractor.extract_text_with_stats(cv_pdf([("same", "Helvetica"), ("same", "Helvetica")]))
+
+    assert ocr_calls == [["same"]]
+    assert text == "same\n\nsame"
+    assert stats == {"pages_total": 2, "pages_reused": 1, "pages_sent": 1}
+
+
+def test_pages_differing_only_in_font_have_different_fingerprints():
+    helvetica = PdfReader(cv_pdf([("\x01\x02", "Helvetica")])).pages[0]
+    symbol = PdfReader(cv_pdf([("\x01\x02", "Symbol")])).pages[0]
+
+    assert helvetica.get_contents().get_data() == symbol.get_contents().get_data()
+    assert PDFExtractor._fingerprint_page(helvetica) != PDFExtractor._fingerprint_page(symbol)
+
+
+def test_regenerated_shared_subset_font_keeps_unchanged_pages(ocr_calls):
+    PDFExtractor.extract_text_with_stats(shared_subset_font_pdf(["one", "two"], "ABCDEF", b"glyphs o n e t w"))
+    text, stats = PDFExtractor.extract_text_with_stats(
+        shared_subset_font_pdf(["one", "two revised"], "GHIJKL", b"glyphs o n e t w r v i s d")
+    )
+
+    assert ocr_calls[-1] == ["two revised"]
+    assert text == "one\n\ntwo revised"
+    assert stats == {"pages_total": 2, "pages_reused": 1, "pages_sent": 1}
+
+
+def test_shared_image_is_hashed_once_per_document(monkeypatch):
+    pdf = build_pdf([
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R 5 0 R] /Count 2 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /XObject << /Im1 7 0 R >> >> >>",
+        stream(b"q 100 0 0 100 72 600 cm /Im1 Do Q BT (one) Tj ET"),
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 6 0 R "
+        b"/Resources << /XObject << /Im1 7 0 R >> >> >>",
+        stream(b"q 100 0 0 100 72 600 cm /Im1 Do Q BT (two) Tj ET"),
+        stream(b"\x00\xff\x00\xff", b"/Type /XObject /Subtype /Image /Width 2 /Height 2 "
+                                      b"/ColorSpace /DeviceGray /BitsPerComponent 8 "),
+    ])
+    pages = PdfReader(io.BytesIO(pdf)).pages
+    image_reads = []
+    for cls in (DecodedStreamObject, EncodedStreamObject):
+        def counting_get_data(self, _get_data=cls.get_data):
+            if self.get("/Subtype") == "/Image":
+                image_reads.append(self)
+            return _get_data(self)
+
+        monkeypatch.setattr(cls, "get_data", counting_get_data)
+    memo = {}
+    fingerprints = [PDFExtractor._fingerprint_page(page, memo) for page in pages]
+
+    assert len(image_reads) == 1
+    assert fingerprints[0] != fingerprints[1]
+    assert fingerprints == [PDFExtractor._fingerprint_page(page) for page in pages]
+
+
+@pytest.mark.parametrize("value, days", [(None, 7), ("", 7), ("7d", 7), ("0", 0), ("1.5", 1.5)])
+def test_cache_ttl_parsing(value, days):
+    assert pdf_extractor._parse_cache_ttl_seconds(value) == days * 24 * 3600
+
+
+def test_self_referencing_form_xobject_is_fingerprinted():
+    pdf = build_pdf([
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /XObject << /X1 5 0 R >> >> >>",
+        stream(b"/X1 Do"),
+        stream(b"/X1 Do", b"/Type /XObject /Subtype /Form /BBox [0 0 10 10] "
+                          b"/Resources << /XObject << /X1 5 0 R >> >> "),
+    ])
+    page = PdfReader(io.BytesIO(pdf)).pages[0]
+
+    assert len(PDFExtractor._fingerprint_page(page)) == 64
+
+
+@pytest.mark.parametrize("content", ["{not json", "[1, 2, 3]", '{"abc": "not an entry"}'])
+def test_corrupt_cache_file_is_ignored(ocr_calls, content):
+    os.makedirs(pdf_extractor.PAGE_CACHE_DIR)
+    with open(os.path.join(pdf_extractor.PAGE_CACHE_DIR, pdf_extractor.PAGE_CACHE_FILE), "w") as f:
+        f.write(content)
+
+    text, stats = PDFExtractor.extract_text_with_stats(cv_pdf([("one", "Helvetica")]))
+
+    assert text == "one"
+    assert stats["pages_sent"] == 1
+
+
+def test_cache_file_is_private_and_entries_expire(ocr_calls):
+    PDFExtractor.extract_text_with_stats(cv_pdf([("one", "Helvetica")]))
+    path = os.path.join(pdf_extractor.PAGE_CACHE_DIR, pdf_extractor.PAGE_CACHE_FILE)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    with open(path) as f:
+        cache = json.load(f)
+    for entry in cache.values():
+        entry["created"] -= pdf_extractor.PAGE_CACHE_TTL_SECONDS + 1
+    with open(path, "w") as f:
+        json.dump(cache, f)
+
+    _, stats = PDFExtractor.extract_text_with_stats(cv_pdf([("one", "Helvetica")]))
+    assert stats["pages_sent"] == 1
+
+
+def test_fallback_when_pdf_cannot_be_split(ocr_calls):
+    text, stats = PDFExtractor.extract_text_with_stats(io.BytesIO(b"not a pdf"))
+
+    assert ocr_calls == [["full document"]]
+    assert text == "full document"
+    assert stats == {"pages_total": 1, "pages_reused": 0, "pages_sent": 1}
+
+
+def test_fallback_when_sub_pdf_cannot_be_written(ocr_calls, monkeypatch):
+    def broken_write(self, stream):
+        raise ValueError("cannot serialize")
+
+    monkeypatch.setattr(PdfWriter, "write", broken_write)
+    pdf = cv_pdf([("one", "Helvetica"), ("two", "Helvetica")])
+
+    text, stats = PDFExtractor.extract_text_with_stats(pdf)
+
+    assert ocr_calls == [["one", "two"]]
+    assert text == "one\n\ntwo"
+    assert stats == {"pages_total": 2, "pages_reused": 0, "pages_sent": 2}